@@ -1,8 +1,11 @@
 import streamlit as st
 import os
+import uuid
 from home import home_page
 from voice import voice_page
 from editor import editor_page
+from ratelimit import bind_client
+from instrumentation import profiled, start_metrics_server
 
 def create_env_file():
     if not os.path.exists(".env"):
@@ -99,9 +102,19 @@ def main():
     if "page" not in st.session_state:
         st.session_state.page = "Welcome"
 
+    # Identify this session so the shared Azure rate limiter can queue sessions fairly
+    if "client_id" not in st.session_state:
+        st.session_state.client_id = uuid.uuid4().hex
+    bind_client(st.session_state.client_id)
+
     st.sidebar.title("Navigation")
     page = st.sidebar.radio("Go to", ["Welcome", "Image to Text", "Voice to Text", "Editor"])
 
+    start_metrics_server()
+    with profiled(page.lower().replace(" ", "_")):
+        render_page(page)
+
+def render_page(page):
     if page == "Welcome":
         st.markdown(""" 
             <div class="hero">
@@ -0,0 +1,439 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from home import read_document, translate_text
+from utils import generate_pdf, generate_word, generate_image, generate_markdown, generate_text, generate_searchable_pdf
+from ratelimit import request_context, PRIORITY_BATCH
+from instrumentation import configure_logging, increment, profiled, start_metrics_server
+from config import LANGUAGES
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+MANIFEST_EXTENSIONS = (".txt", ".lst", ".manifest")
+JOURNAL_NAME = ".batch_journal.jsonl"
+# Per-page Read API layout kept for combined searchable PDFs
+LAYOUT_EXTENSION = ".layout.json"
+
+# Export format -> (generator, file extension)
+EXPORTERS = {
+    "pdf": (generate_pdf, ".pdf"),
+    "docx": (generate_word, ".docx"),
+    "png": (generate_image, ".png"),
+    "md": (generate_markdown, ".md"),
+    "txt": (generate_text, ".txt"),
+}
+# Rendered from the original scan and the OCR layout rather than from text alone
+SEARCHABLE_PDF_FORMAT = "searchable-pdf"
+EXPORT_FORMATS = sorted(EXPORTERS) + [SEARCHABLE_PDF_FORMAT]
+
+_DONE = object()
+
+
+def is_ocr_failure(text):
+    """Return True if perform_ocr returned one of its error strings"""
+    return not text or text.startswith(("OCR Failed", "OCR Error"))
+
+
+def is_translation_failure(text):
+    """Return True if translate_text returned one of its error strings"""
+    return not text or text.startswith(("Translation Failed", "Translation Error"))
+
+
+def resolve_language_code(language):
+    """Accept either a language name from LANGUAGES or a language code"""
+    if not language:
+        return None
+    if language in LANGUAGES:
+        return LANGUAGES[language]
+    if language in LANGUAGES.values():
+        return language
+    raise ValueError(f"Unknown language: {language}")
+
+
+def _read_manifest(manifest_path):
+    """Yield (source, relpath) pairs from a manifest listing one image path per line"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    # Outputs of each manifest go into a subfolder named after it
+    root_name = os.path.splitext(os.path.basename(manifest_path))[0]
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            entry = line.strip()
+            if not entry or entry.startswith("#"):
+                continue
+            source = entry if os.path.isabs(entry) else os.path.join(base_dir, entry)
+            source = os.path.abspath(source)
+            if source.startswith(base_dir + os.sep):
+                relpath = os.path.relpath(source, base_dir)
+            else:
+                relpath = os.path.basename(source)
+            yield source, os.path.join(root_name, relpath)
+
+
+def discover_inputs(paths):
+    """
+    Walk directories, manifests and single images, yielding (source, relpath) pairs lazily.
+    relpath keeps the image extension and starts with the input directory or manifest name,
+    so files from different inputs map to different outputs.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            root_dir = os.path.abspath(path)
+            for dirpath, dirnames, filenames in os.walk(root_dir):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        source = os.path.join(dirpath, name)
+                        yield source, os.path.join(os.path.basename(root_dir), os.path.relpath(source, root_dir))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            yield os.path.abspath(path), os.path.basename(path)
+        elif path.lower().endswith(MANIFEST_EXTENSIONS):
+            yield from _read_manifest(path)
+        else:
+            logger.warning(f"Skipping unsupported input: {path}")
+
+
+def _journal_key(source):
+    """Identify a source file by path, size and modification time"""
+    stat = os.stat(source)
+    return f"{source}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_journal(journal_path):
+    """
+    Return {(journal key, relpath): {format: language}} for outputs that were written successfully.
+    Later entries win, so an output rewritten for another language only counts for that language.
+    """
+    completed = {}
+    if not os.path.exists(journal_path):
+        return completed
+    with open(journal_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; ignore it
+                continue
+            if entry.get("status") == "done":
+                formats = completed.setdefault((entry["key"], entry.get("relpath")), {})
+                formats.update(entry.get("formats", {}))
+    return completed
+
+
+def _write_atomic(path, data):
+    """Write bytes to path via a temporary file so partial outputs never appear"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class BatchPipeline:
+    """Streaming OCR -> translate -> export pipeline with a bounded worker pool per stage"""
+
+    def __init__(self, output_dir, formats=("txt",), target_language=None,
+                 ocr_workers=4, translate_workers=2, export_workers=2, resume=True,
+                 combine_searchable_pdf=False):
+        unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+        if unknown:
+            raise ValueError(f"Unsupported export format(s): {', '.join(unknown)}")
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.target_language = resolve_language_code(target_language)
+        self.resume = resume
+        self.combine_searchable_pdf = combine_searchable_pdf and SEARCHABLE_PDF_FORMAT in self.formats
+        self.journal_path = os.path.join(output_dir, JOURNAL_NAME)
+
+        stages = [("ocr", self._ocr, ocr_workers)]
+        if self.target_language and self.target_language != "en":
+            stages.append(("translate", self._translate, translate_workers))
+        stages.append(("export", self._export, export_workers))
+        self._stages = stages
+        self._stop = threading.Event()
+
+    def _output_language(self, fmt):
+        """Language an output of fmt is written in; searchable PDFs always carry the OCR text"""
+        if fmt == SEARCHABLE_PDF_FORMAT or self.target_language == "en":
+            return None
+        return self.target_language
+
+    def _pending_formats(self, done):
+        """Requested formats whose output is missing or was written for another language"""
+        return [fmt for fmt in self.formats if fmt not in done or done[fmt] != self._output_language(fmt)]
+
+    def _layout_path(self, relpath):
+        return os.path.join(self.output_dir, relpath + LAYOUT_EXTENSION)
+
+    def _ocr(self, item):
+        with open(item["source"], "rb") as f:
+            image_bytes = f.read()
+        text, read_results = read_document(image_bytes)
+        if is_ocr_failure(text):
+            raise RuntimeError(text)
+        item["text"] = text
+        if SEARCHABLE_PDF_FORMAT in item["formats"]:
+            item["ocr_text"] = text
+            item["read_results"] = read_results
+
+    def _translate(self, item):
+        if all(fmt == SEARCHABLE_PDF_FORMAT for fmt in item["formats"]):
+            return
+        translated = translate_text(item["text"], self.target_language)
+        if is_translation_failure(translated):
+            raise RuntimeError(translated)
+        item["text"] = translated
+
+    def _export(self, item):
+        # Keep the image extension so a.png and a.jpg don't export to the same file
+        stem = item["relpath"]
+        outputs = []
+        for fmt in item["formats"]:
+            if fmt == SEARCHABLE_PDF_FORMAT and item.get("root"):
+                # Combined PDFs are assembled from these after the run, in input order
+                path = self._layout_path(stem)
+                layout = {"read_results": item["read_results"], "text": item["ocr_text"]}
+                _write_atomic(path, json.dumps(layout).encode("utf-8"))
+            elif fmt == SEARCHABLE_PDF_FORMAT:
+                path = os.path.join(self.output_dir, stem + ".searchable.pdf")
+                # Re-read the scan here instead of carrying image bytes through the queues
+                with open(item["source"], "rb") as f:
+                    page = (f.read(), item["read_results"], item["ocr_text"])
+                _write_atomic(path, generate_searchable_pdf([page]))
+            else:
+                generator, extension = EXPORTERS[fmt]
+                path = os.path.join(self.output_dir, stem + extension)
+                _write_atomic(path, generator(item["text"]))
+            outputs.append(path)
+        item["outputs"] = outputs
+
+    def _worker(self, name, func, inbox, outbox):
+        # Batch calls yield to interactive sessions in the shared Azure rate limiter
+        with request_context(client="batch", priority=PRIORITY_BATCH):
+            self._process(name, func, inbox, outbox)
+
+    def _process(self, name, func, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            if "error" not in item and not self._stop.is_set():
+                started = time.time()
+                try:
+                    with profiled(f"batch_{name}"):
+                        func(item)
+                except Exception as e:
+                    logger.error(f"Batch {name} failed for {item['source']}: {str(e)}")
+                    item["error"] = f"{name}: {str(e)}"
+                item.setdefault("timings", {})[name] = round(time.time() - started, 3)
+            outbox.put(item)
+
+    def _start_stage(self, name, func, workers, inbox, outbox, downstream_workers):
+        """Start a stage's workers and a closer that signals end-of-stream once they all finish"""
+        threads = [
+            threading.Thread(target=self._worker, args=(name, func, inbox, outbox),
+                             name=f"batch-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        def close():
+            for thread in threads:
+                thread.join()
+            for _ in range(downstream_workers):
+                outbox.put(_DONE)
+
+        threading.Thread(target=close, name=f"batch-{name}-closer", daemon=True).start()
+
+    def _combines(self, path):
+        """Whether the pages of an input path go into one searchable PDF"""
+        return self.combine_searchable_pdf and (os.path.isdir(path) or path.lower().endswith(MANIFEST_EXTENSIONS))
+
+    def _discover(self, inputs):
+        """discover_inputs, adding the directory or manifest each image came from when combining PDFs"""
+        for path in inputs:
+            root = path if self._combines(path) else None
+            for source, relpath in discover_inputs([path]):
+                yield source, relpath, root
+
+    def _feed(self, inputs, inbox, worker_count, skipped):
+        completed = load_journal(self.journal_path) if self.resume else {}
+        claimed = {}  # normalised relpath -> first source that maps to it
+        try:
+            for source, relpath, root in self._discover(inputs):
+                if self._stop.is_set():
+                    break
+                try:
+                    key = _journal_key(source)
+                except OSError as e:
+                    logger.error(f"Cannot read {source}: {str(e)}")
+                    continue
+                owner = claimed.setdefault(os.path.normcase(relpath), source)
+                if owner != source:
+                    error = f"discover: output {relpath} already used by {owner}"
+                    logger.error(f"Batch skipping {source}: {error}")
+                    inbox.put({"source": source, "relpath": relpath, "key": key, "error": error})
+                    continue
+                # Only the outputs this run asks for and has not written yet are (re)generated
+                formats = self._pending_formats(completed.get((key, relpath), {}))
+                if root and SEARCHABLE_PDF_FORMAT not in formats and not os.path.exists(self._layout_path(relpath)):
+                    # Journaled as a single-page PDF by an earlier run without combining
+                    formats.append(SEARCHABLE_PDF_FORMAT)
+                if not formats:
+                    skipped.append(source)
+                    increment("cache_hits", cache="batch_journal")
+                    continue
+                inbox.put({"source": source, "relpath": relpath, "key": key, "formats": formats, "root": root})
+        finally:
+            for _ in range(worker_count):
+                inbox.put(_DONE)
+
+    def run(self, inputs):
+        """Process every input and return a summary of done/failed/skipped counts"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = {"done": 0, "failed": 0, "skipped": 0}
+        skipped = []
+
+        # Bounded queues give back-pressure so memory stays flat regardless of input size
+        worker_counts = [max(1, workers) for _, _, workers in self._stages]
+        queues = [queue.Queue(maxsize=count * 2) for count in worker_counts]
+        results = queue.Queue(maxsize=64)
+        outboxes = queues[1:] + [results]
+        downstream_counts = worker_counts[1:] + [1]
+
+        for (name, func, _), count, inbox, outbox, downstream in zip(
+                self._stages, worker_counts, queues, outboxes, downstream_counts):
+            self._start_stage(name, func, count, inbox, outbox, downstream)
+
+        feeder = threading.Thread(target=self._feed, args=(inputs, queues[0], worker_counts[0], skipped),
+                                  name="batch-feeder", daemon=True)
+        feeder.start()
+
+        started = time.time()
+        changed_roots = set()  # inputs whose combined searchable PDF needs rebuilding
+        try:
+            with open(self.journal_path, "a", encoding="utf-8") as journal:
+                while True:
+                    item = results.get()
+                    if item is _DONE:
+                        break
+                    status = "failed" if "error" in item else "done"
+                    summary[status] += 1
+                    if item.get("root"):
+                        changed_roots.add(item["root"])
+                    entry = {
+                        "key": item["key"],
+                        "source": item["source"],
+                        "relpath": item["relpath"],
+                        "status": status,
+                        "formats": {fmt: self._output_language(fmt) for fmt in item.get("formats", [])},
+                        "outputs": item.get("outputs", []),
+                        "timings": item.get("timings", {}),
+                        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    }
+                    if "error" in item:
+                        entry["error"] = item["error"]
+                    journal.write(json.dumps(entry) + "\n")
+                    journal.flush()
+                    processed = summary["done"] + summary["failed"]
+                    if processed % 100 == 0:
+                        rate = processed / max(time.time() - started, 1e-6) * 3600
+                        logger.info(f"Batch progress: {processed} processed, {rate:.0f} files/hour")
+        except KeyboardInterrupt:
+            self._stop.set()
+            logger.warning("Batch interrupted; finished files are recorded in the journal")
+            raise
+
+        for root in dict.fromkeys(inputs):
+            if not self._combines(root) or self._stop.is_set():
+                continue
+            # Rebuild documents with new pages, or whose PDF an interrupted run never wrote
+            if root in changed_roots or not os.path.exists(self._combined_path(root)):
+                if not self._write_combined(root):
+                    summary["failed"] += 1
+
+        summary["skipped"] = len(skipped)
+        logger.info(f"Batch finished: {summary}")
+        return summary
+
+    def _combined_path(self, root):
+        # Named like the folder discover_inputs puts the pages' other outputs in
+        root_name = os.path.basename(os.path.abspath(root))
+        if not os.path.isdir(root):
+            root_name = os.path.splitext(root_name)[0]
+        return os.path.join(self.output_dir, root_name + ".searchable.pdf")
+
+    def _combined_pages(self, root):
+        """Yield (image_bytes, read_results, fallback_text) for the pages of root in input order"""
+        for source, relpath in discover_inputs([root]):
+            try:
+                with open(self._layout_path(relpath), encoding="utf-8") as f:
+                    layout = json.load(f)
+                with open(source, "rb") as f:
+                    image_bytes = f.read()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Leaving {source} out of the combined PDF: {str(e)}")
+                continue
+            yield image_bytes, layout["read_results"], layout["text"]
+
+    def _write_combined(self, root):
+        """Stream the pages of an input directory or manifest into one searchable PDF"""
+        path = self._combined_path(root)
+        tmp_path = f"{path}.part"
+        try:
+            generate_searchable_pdf(self._combined_pages(root), tmp_path)
+            os.replace(tmp_path, path)
+            logger.info(f"Wrote combined searchable PDF {path}")
+            return True
+        except Exception as e:
+            logger.error(f"Batch could not combine {root} into one PDF: {str(e)}")
+            return False
+
+
+def run_batch(inputs, output_dir, **options):
+    """Run the batch pipeline over input paths; see BatchPipeline for options"""
+    return BatchPipeline(output_dir, **options).run(inputs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch OCR -> translate -> export over directories of scans")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or manifest files (one path per line)")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory for exported files and the checkpoint journal")
+    parser.add_argument("-f", "--format", dest="formats", action="append", choices=EXPORT_FORMATS,
+                        help="Export format (repeatable, default: txt)")
+    parser.add_argument("-t", "--translate", dest="target_language", help="Target language name or code")
+    parser.add_argument("--ocr-workers", type=int, default=4)
+    parser.add_argument("--translate-workers", type=int, default=2)
+    parser.add_argument("--export-workers", type=int, default=2)
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Ignore the checkpoint journal and reprocess every file")
+    parser.add_argument("--combine-searchable-pdf", action="store_true",
+                        help="Write one searchable PDF per input directory or manifest, pages in input order")
+    args = parser.parse_args(argv)
+
+    start_metrics_server()
+    with profiled("batch"):
+        summary = run_batch(
+            args.inputs,
+            args.output_dir,
+            formats=args.formats or ["txt"],
+            target_language=args.target_language,
+            ocr_workers=args.ocr_workers,
+            translate_workers=args.translate_workers,
+            export_workers=args.export_workers,
+            resume=args.resume,
+            combine_searchable_pdf=args.combine_searchable_pdf,
+        )
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
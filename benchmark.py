@@ -0,0 +1,245 @@
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Project modules read their endpoints from config at import time, so they are
+# imported inside measure_scenario() after the environment has been pointed at the mock server.
+# Each scenario runs in a fresh process so its peak RSS doesn't include earlier scenarios.
+
+SCENARIOS = ("ocr", "translate", "translate_azure", "export_pdf", "export_docx",
+             "export_image", "export_markdown", "export_text")
+DEFAULT_SCENARIOS = ("ocr", "translate", "export_docx", "export_image", "export_markdown", "export_text")
+
+SAMPLE_TEXT = (
+    "Dear diary, today we digitised the handwritten notebook from the archive. "
+    "The pages were scanned at three hundred dots per inch and passed through OCR. "
+) * 8
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct * len(sorted_values) / 100.0) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def git_revision():
+    """Return (commit, dirty) for the working tree, or (None, None) outside git"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             text=True, stderr=subprocess.DEVNULL).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_scenario(name, func, requests_count, concurrency):
+    """Call func requests_count times across concurrency threads and summarise latency"""
+    def timed_call(_):
+        started = time.perf_counter()
+        try:
+            ok = func()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Benchmark {name} call failed: {str(e)}")
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_call, range(requests_count)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        "scenario": name,
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_sec": round(len(latencies) / wall, 3) if wall else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def build_scenarios(selected):
+    """Map scenario names to zero-argument callables returning True on success"""
+    from home import perform_ocr, translate_text
+    from batch import is_ocr_failure, is_translation_failure
+    from utils import generate_pdf, generate_word, generate_image, generate_markdown, generate_text
+
+    image_bytes = generate_image(SAMPLE_TEXT, width=1600, height=1200, font_size=28)
+    scenarios = {
+        "ocr": lambda: not is_ocr_failure(perform_ocr(image_bytes, reuse_duplicates=False)),
+        "translate": lambda: not is_translation_failure(translate_text(SAMPLE_TEXT, "ta")),
+        "export_pdf": lambda: bool(generate_pdf(SAMPLE_TEXT)),
+        "export_docx": lambda: bool(generate_word(SAMPLE_TEXT)),
+        "export_image": lambda: bool(generate_image(SAMPLE_TEXT)),
+        "export_markdown": lambda: bool(generate_markdown(SAMPLE_TEXT)),
+        "export_text": lambda: bool(generate_text(SAMPLE_TEXT)),
+    }
+    if "translate_azure" in selected:
+        try:
+            from voice import translate_text_azure
+            scenarios["translate_azure"] = lambda: not translate_text_azure(SAMPLE_TEXT, "ta").startswith("Translation failed")
+        except ImportError as e:
+            logging.getLogger(__name__).warning(f"Skipping translate_azure: {str(e)}")
+    return {name: scenarios[name] for name in selected if name in scenarios}
+
+
+def prepare_environment(args):
+    """Point config at the mock server (unless --live) and apply overrides; return the mock options"""
+    mock_options = None
+    if not args.live:
+        mock_options = {
+            "ocr_latency": args.ocr_latency,
+            "translate_latency": args.translate_latency,
+            "throttle_rate": args.throttle_rate,
+            "retry_after": args.retry_after,
+        }
+        os.environ["AZURE_OCR_POLL_INTERVAL"] = str(args.poll_interval)
+        os.environ.setdefault("AZURE_OCR_KEY", "mock")
+        os.environ.setdefault("AZURE_TRANSLATOR_KEY", "mock")
+    if args.rate_limit:
+        for service in ("OCR", "TRANSLATOR"):
+            os.environ[f"AZURE_{service}_RATE_LIMIT"] = str(args.rate_limit)
+            os.environ[f"AZURE_{service}_BURST"] = str(max(int(args.rate_limit), 1))
+
+    if mock_options is not None:
+        from mock_azure import start_mock_server
+        # Start the mock before config is imported so the endpoints below take effect
+        server, base_url = start_mock_server(**mock_options)
+        os.environ["AZURE_OCR_ENDPOINT"] = base_url
+        os.environ["AZURE_TRANSLATOR_ENDPOINT"] = base_url
+    return mock_options
+
+
+def measure_scenario(name, args):
+    """Run one scenario in the current (fresh) process and return its record, or None if unavailable"""
+    mock_options = prepare_environment(args)
+    from instrumentation import registry
+    from config import AZURE_OCR_POLL_INTERVAL, RATE_LIMITS
+
+    scenarios = build_scenarios([name])
+    if name not in scenarios:
+        return None
+    record = run_scenario(name, scenarios[name], args.requests, args.concurrency)
+    record.update({
+        "mock": mock_options,
+        # Effective settings after --poll-interval/--rate-limit and the environment
+        "poll_interval": AZURE_OCR_POLL_INTERVAL,
+        "rate_limits": {service: list(limit) for service, limit in sorted(RATE_LIMITS.items())},
+        "retries": sum(c["value"] for c in registry.snapshot()["counters"] if c["name"] == "retries"),
+    })
+    return record
+
+
+def compare(records, baseline_path):
+    """Print throughput and p95 deltas against the latest matching run in baseline_path"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = [json.loads(line) for line in f if line.strip()]
+    for record in records:
+        matches = [
+            old for old in baseline
+            if old["scenario"] == record["scenario"]
+            and old["requests"] == record["requests"]
+            and old["concurrency"] == record["concurrency"]
+            and old.get("mock") == record.get("mock")
+            and old.get("poll_interval") == record.get("poll_interval")
+            and old.get("rate_limits") == record.get("rate_limits")
+            and old.get("run_id") != record.get("run_id")
+        ]
+        if not matches:
+            print(f"{record['scenario']:<16} no comparable baseline")
+            continue
+        old = matches[-1]
+        for key in ("throughput_per_sec", "p95_ms"):
+            if old.get(key) and record.get(key) is not None:
+                change = (record[key] - old[key]) / old[key] * 100
+                print(f"{record['scenario']:<16} {key:<20} {old[key]:>10} -> {record[key]:>10} "
+                      f"({change:+.1f}% vs {old.get('commit')})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for OCR, translation and export")
+    parser.add_argument("-s", "--scenario", dest="scenarios", action="append", choices=SCENARIOS,
+                        help=f"Scenario to run (repeatable, default: {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument("-n", "--requests", type=int, default=50, help="Calls per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Concurrent callers per scenario")
+    parser.add_argument("--live", action="store_true",
+                        help="Use the Azure endpoints from the environment instead of the local mock")
+    parser.add_argument("--ocr-latency", type=float, default=0.5, help="Mock Read API processing time in seconds")
+    parser.add_argument("--translate-latency", type=float, default=0.02, help="Mock Translator latency in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of mock requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on mock 429 responses")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Read API poll interval used against the mock")
+    parser.add_argument("--rate-limit", type=float, help="Override the per-service rate limit (requests per second)")
+    parser.add_argument("-o", "--output", default="benchmark_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--compare", metavar="JSONL", help="Compare against the latest matching runs in this file")
+    args = parser.parse_args(argv)
+
+    commit, dirty = git_revision()
+    run_id = f"{int(time.time())}-{os.getpid()}"
+    # spawn rather than fork: the child must import config after prepare_environment()
+    context = multiprocessing.get_context("spawn")
+
+    records = []
+    for name in dict.fromkeys(args.scenarios or DEFAULT_SCENARIOS):
+        with context.Pool(1) as pool:
+            record = pool.apply(measure_scenario, (name, args))
+        if record is None:
+            continue
+        record.update({
+            "run_id": run_id,
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+        })
+        records.append(record)
+        print(f"{name:<16} {record['throughput_per_sec']:>8} req/s  p50 {record['p50_ms']} ms  "
+              f"p95 {record['p95_ms']} ms  p99 {record['p99_ms']} ms  errors {record['errors']}  "
+              f"peak RSS {record['peak_rss_mb']} MiB  429 retries {record['retries']}")
+
+    with open(args.output, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+    if args.compare:
+        compare(records, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,6 +7,8 @@ load_dotenv()
 # Azure API configuration
 AZURE_OCR_KEY = os.environ.get("AZURE_OCR_KEY", "")
 AZURE_OCR_ENDPOINT = os.environ.get("AZURE_OCR_ENDPOINT", "")
+AZURE_OCR_POLL_INTERVAL = float(os.environ.get("AZURE_OCR_POLL_INTERVAL", "3"))
+AZURE_OCR_POLL_ATTEMPTS = int(os.environ.get("AZURE_OCR_POLL_ATTEMPTS", "10"))
 
 AZURE_TRANSLATOR_KEY = os.environ.get("AZURE_TRANSLATOR_KEY", " ")
 AZURE_TRANSLATOR_ENDPOINT = os.environ.get("AZURE_TRANSLATOR_ENDPOINT", "")
@@ -18,6 +20,38 @@ AZURE_SPEECH_REGION = os.environ.get("AZURE_SPEECH_REGION", "centralindia")
 # Path configurations
 WKHTMLTOPDF_PATH = os.environ.get("WKHTMLTOPDF_PATH", r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe")
 
+# Searchable PDF export: resolution assumed for scans without usable DPI metadata,
+# and an optional TTF/OTF font for the text layer, preferred over the built-in Helvetica/Noto/CJK fonts
+SEARCHABLE_PDF_DPI = int(os.environ.get("SEARCHABLE_PDF_DPI", "200"))
+SEARCHABLE_PDF_FONT_FILE = os.environ.get("SEARCHABLE_PDF_FONT_FILE", "")
+
+# Near-duplicate page detection within a session: minimum perceptual-hash similarity (0..1)
+# for a candidate, minimum block-wise content correlation (-1..1) before offering its earlier
+# OCR result, and how many pages each session remembers (about 64 KB each)
+OCR_DEDUP_SIMILARITY = float(os.environ.get("OCR_DEDUP_SIMILARITY", "0.9"))
+OCR_DEDUP_CONTENT_MATCH = float(os.environ.get("OCR_DEDUP_CONTENT_MATCH", "0.3"))
+OCR_DEDUP_MAX_PAGES = int(os.environ.get("OCR_DEDUP_MAX_PAGES", "200"))
+
+# Background job configuration
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "8"))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "600"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+
+# Shared rate limits per Azure service: (requests per second, burst size)
+RATE_LIMITS = {
+    "ocr": (float(os.environ.get("AZURE_OCR_RATE_LIMIT", "10")), int(os.environ.get("AZURE_OCR_BURST", "10"))),
+    "translator": (float(os.environ.get("AZURE_TRANSLATOR_RATE_LIMIT", "10")), int(os.environ.get("AZURE_TRANSLATOR_BURST", "10"))),
+    "speech": (float(os.environ.get("AZURE_SPEECH_RATE_LIMIT", "5")), int(os.environ.get("AZURE_SPEECH_BURST", "5"))),
+}
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Instrumentation: METRICS_EXPORT is "", "prometheus" (serve METRICS_PORT) or "json" (structured logs)
+METRICS_EXPORT = os.environ.get("METRICS_EXPORT", "").lower()
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+# PROFILE_MODE is "", "cprofile" or "tracemalloc"
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "").lower()
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
 # Language mapping
 LANGUAGES = {
     "English": "en", "Tamil": "ta", "Hindi": "hi", "French": "fr", "German": "de",
@@ -0,0 +1,219 @@
+import logging
+import threading
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from instrumentation import configure_logging, span
+from config import OCR_DEDUP_SIMILARITY, OCR_DEDUP_CONTENT_MATCH, OCR_DEDUP_MAX_PAGES
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+SAMPLE_SIZE = 256
+# Blocks compared between two pages; a block row is roughly one line of text
+BLOCK_ROWS, BLOCK_COLUMNS = 32, 8
+BLOCK_HEIGHT, BLOCK_WIDTH = SAMPLE_SIZE // BLOCK_ROWS, SAMPLE_SIZE // BLOCK_COLUMNS
+# Pixels a block may be offset by on the sample (re-photographed or re-cropped page)
+MAX_SHIFT = 4
+# Horizontal detail kept by the content map: strokes and word gaps, not the line layout
+DETAIL_RADIUS = 6
+# Content maps are stored as int8 with this many steps per unit of normalized detail
+CONTENT_SCALE = 32
+# Closest hash candidates that get the (slower) content comparison
+MAX_CONTENT_CHECKS = 4
+
+
+def _grayscale_sample(image_bytes):
+    """Decode image bytes (e.g. the grayscale PNG from preprocess_image) into a SAMPLE_SIZE square image"""
+    image = Image.open(BytesIO(image_bytes)).convert("L")
+    return image.resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.flatten().astype(np.uint8)).tobytes(), "big")
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis so that dct(x) = M @ x"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def phash(sample):
+    """64-bit perceptual hash: low-frequency 8x8 DCT coefficients of a 32x32 thumbnail vs. their median"""
+    pixels = np.asarray(sample.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    coefficients = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8]
+    # The DC term only reflects overall brightness, so keep it out of the threshold
+    median = np.median(coefficients.flatten()[1:])
+    return _bits_to_int(coefficients > median)
+
+
+def _moving_average(values, radius, axis):
+    window = 2 * radius + 1
+    padding = [(0, 0), (0, 0)]
+    padding[axis] = (radius + 1, radius)
+    sums = np.pad(values, padding, mode="edge").cumsum(axis=axis)
+    return (np.delete(sums, np.s_[:window], axis=axis) - np.delete(sums, np.s_[-window:], axis=axis)) / window
+
+
+def content_map(sample):
+    """
+    Horizontal detail of a sample, normalized for local contrast, as int8 (64 KB).
+    Subtracting the row-wise moving average removes the line layout that all text
+    pages share, so what is left depends on the actual strokes and word gaps.
+    """
+    pixels = np.asarray(sample, dtype=np.float64)
+    detail = pixels - _moving_average(pixels, DETAIL_RADIUS, axis=1)
+    energy = _moving_average(_moving_average(detail ** 2, DETAIL_RADIUS, axis=1), DETAIL_RADIUS, axis=0)
+    # The constant keeps blank paper from being amplified into noise
+    detail = detail / np.sqrt(energy + 25.0)
+    return np.clip(np.round(detail * CONTENT_SCALE), -127, 127).astype(np.int8)
+
+
+def fingerprint(image_bytes):
+    """(phash, content_map) of a processed page, decoding it once"""
+    sample = _grayscale_sample(image_bytes)
+    return phash(sample), content_map(sample)
+
+
+def _query_blocks(query):
+    """Spectra and norms of a content map's zero-mean blocks, shared across candidates"""
+    blocks = query.astype(np.float64).reshape(BLOCK_ROWS, BLOCK_HEIGHT, BLOCK_COLUMNS, BLOCK_WIDTH)
+    blocks = blocks.swapaxes(1, 2).reshape(-1, BLOCK_HEIGHT, BLOCK_WIDTH)
+    blocks = blocks - blocks.mean(axis=(1, 2), keepdims=True)
+    window_shape = (BLOCK_HEIGHT + 2 * MAX_SHIFT, BLOCK_WIDTH + 2 * MAX_SHIFT)
+    return np.conj(np.fft.rfft2(blocks, s=window_shape)), np.sqrt((blocks ** 2).sum(axis=(1, 2)))
+
+
+def _block_scores(query_blocks, stored):
+    """Best normalized cross-correlation of every query block within MAX_SHIFT of its place in stored"""
+    spectra, block_norms = query_blocks
+    window_shape = (BLOCK_HEIGHT + 2 * MAX_SHIFT, BLOCK_WIDTH + 2 * MAX_SHIFT)
+    offsets = 2 * MAX_SHIFT + 1
+    padded = np.pad(stored.astype(np.float64), MAX_SHIFT, mode="edge")
+
+    # Correlate every block with its window at all offsets at once in the frequency domain
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window_shape)
+    windows = windows[::BLOCK_HEIGHT, ::BLOCK_WIDTH].reshape(-1, *window_shape)
+    products = np.fft.irfft2(np.fft.rfft2(windows) * spectra, s=window_shape)[:, :offsets, :offsets]
+
+    # Window sums and sums of squares at every offset from integral images
+    rows = (np.arange(BLOCK_ROWS) * BLOCK_HEIGHT)[:, None, None, None] + np.arange(offsets)[:, None]
+    columns = (np.arange(BLOCK_COLUMNS) * BLOCK_WIDTH)[None, :, None, None] + np.arange(offsets)
+
+    def box_sums(values):
+        integral = np.pad(values.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        sums = (integral[rows + BLOCK_HEIGHT, columns + BLOCK_WIDTH] - integral[rows, columns + BLOCK_WIDTH]
+                - integral[rows + BLOCK_HEIGHT, columns] + integral[rows, columns])
+        return sums.reshape(-1, offsets, offsets)
+
+    sums, squares = box_sums(padded), box_sums(padded ** 2)
+    window_norms = np.sqrt(np.maximum(squares - sums ** 2 / (BLOCK_HEIGHT * BLOCK_WIDTH), 1e-9))
+    scores = products / (window_norms * block_norms[:, None, None] + 1e-9)
+    return scores.reshape(len(block_norms), -1).max(axis=1), window_norms[:, MAX_SHIFT, MAX_SHIFT]
+
+
+def _weakest_block(query_blocks, stored):
+    scores, stored_norms = _block_scores(query_blocks, stored)
+    block_norms = query_blocks[1]
+    # A block counts if either page has writing there
+    inked = (block_norms > 0.2 * block_norms.max()) | (stored_norms > 0.2 * stored_norms.max())
+    return float(scores[inked].min()) if inked.any() else 0.0
+
+
+def content_similarity(query, stored):
+    """
+    Weakest block match (-1..1) between two content maps: each block's best
+    normalized cross-correlation over offsets up to MAX_SHIFT. Blank blocks are
+    skipped, so a single changed line is enough to reject the pair.
+    """
+    return _weakest_block(_query_blocks(query), stored)
+
+
+def _popcount(values):
+    """Set bits per element of a uint64 array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    # NumPy < 2.0: SWAR popcount
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def max_distance_for(similarity):
+    """Largest Hamming distance between 64-bit hashes that still meets similarity (0..1)"""
+    return max(int((1.0 - similarity) * HASH_BITS), 0)
+
+
+class OcrResultIndex:
+    """
+    Per-session map from processed pages to their OCR text, holding at most
+    max_pages entries (the oldest are replaced). It is sized for the pages one
+    user works through, not a shared archive: every lookup scans all hashes and
+    each entry keeps a 64 KB content map, so it is not meant for millions of pages.
+
+    A pHash within max_distance only nominates a candidate: pHashes of text pages
+    are strongly correlated, so the closest few candidates must also pass
+    content_similarity before their text is offered. A lookup costs about 10 ms
+    to decode the page plus up to MAX_CONTENT_CHECKS comparisons of about 8 ms.
+    """
+
+    def __init__(self, similarity=OCR_DEDUP_SIMILARITY, content_match=OCR_DEDUP_CONTENT_MATCH,
+                 max_pages=OCR_DEDUP_MAX_PAGES):
+        self.max_distance = max_distance_for(similarity)
+        self.content_match = content_match
+        self.max_pages = max_pages
+        self._phashes = np.zeros(max_pages, dtype=np.uint64)
+        # (content map, text) per slot, replaced as a whole so a lookup never pairs one page's map with another's text
+        self._entries = [None] * max_pages
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._added, self.max_pages)
+
+    def lookup(self, processed_image):
+        """Return {"text", "similarity"} for the best confirmed earlier page, or None"""
+        try:
+            with span("dedup_lookup"):
+                phash_value, query = fingerprint(processed_image)
+                with self._lock:
+                    hashes, entries = self._phashes[:len(self)].copy(), list(self._entries)
+                distances = _popcount(hashes ^ np.uint64(phash_value))
+                candidates = np.flatnonzero(distances <= self.max_distance)
+                candidates = candidates[np.argsort(distances[candidates], kind="stable")][:MAX_CONTENT_CHECKS]
+                if not len(candidates):
+                    return None
+                query_blocks = _query_blocks(query)
+                best, best_score = None, self.content_match
+                for slot in candidates:
+                    stored, text = entries[slot]
+                    score = _weakest_block(query_blocks, stored)
+                    if score >= best_score:
+                        best_score = score
+                        best = {"text": text, "similarity": 1.0 - int(distances[slot]) / HASH_BITS}
+                return best
+        except Exception as e:
+            logger.error(f"Error looking up duplicate page: {str(e)}")
+        return None
+
+    def add(self, processed_image, text):
+        """Remember the OCR text for a processed page"""
+        try:
+            phash_value, stored = fingerprint(processed_image)
+            with self._lock:
+                slot = self._added % self.max_pages
+                self._phashes[slot] = phash_value
+                self._entries[slot] = (stored, text)
+                self._added += 1
+        except Exception as e:
+            logger.error(f"Error adding page to duplicate index: {str(e)}")
@@ -4,11 +4,13 @@ from streamlit_quill import st_quill
 import logging
 from utils import generate_pdf, generate_word, generate_image, generate_markdown, generate_text
 import time
+from instrumentation import configure_logging, timed
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
+@timed("pdf_extract")
 def extract_text_from_pdf(pdf_file):
     """Extract text from PDF file"""
     try:
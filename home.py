@@ -1,17 +1,22 @@
 import streamlit as st
-import requests
 import os
 import logging
 import time
+import hashlib
 from io import BytesIO
 from PIL import Image, ImageEnhance, ImageFilter
-from utils import generate_pdf, generate_word, generate_image, generate_markdown, generate_text
-from config import AZURE_OCR_KEY, AZURE_OCR_ENDPOINT, AZURE_TRANSLATOR_KEY, AZURE_TRANSLATOR_ENDPOINT, AZURE_TRANSLATOR_REGION, LANGUAGES
+from utils import generate_pdf, generate_word, generate_image, generate_markdown, generate_text, generate_searchable_pdf
+from jobs import ensure_job, FAILED
+from ratelimit import limited_request
+from instrumentation import configure_logging, span, timed, increment
+from dedupe import OcrResultIndex
+from config import AZURE_OCR_KEY, AZURE_OCR_ENDPOINT, AZURE_TRANSLATOR_KEY, AZURE_TRANSLATOR_ENDPOINT, AZURE_TRANSLATOR_REGION, LANGUAGES, JOB_POLL_INTERVAL, AZURE_OCR_POLL_INTERVAL, AZURE_OCR_POLL_ATTEMPTS
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
+@timed("preprocess")
 def preprocess_image(image_bytes):
     """Preprocess image to improve OCR accuracy"""
     try:
@@ -29,42 +34,82 @@ def preprocess_image(image_bytes):
         logger.error(f"Error preprocessing image: {str(e)}")
         return image_bytes
 
-def perform_ocr(image_bytes):
-    """Perform OCR on image using Azure Read API"""
+def get_session_ocr_index():
+    """Return this session's index of OCR'd pages; results are never shared between sessions"""
+    if "ocr_index" not in st.session_state:
+        st.session_state.ocr_index = OcrResultIndex()
+    return st.session_state.ocr_index
+
+def read_document(image_bytes, on_progress=None, duplicate_index=None, reuse_duplicates=False):
+    """
+    Run the Azure Read API on an image and return (text, read_results).
+    read_results holds the per-page line/word bounding boxes, or None when OCR failed
+    or the text was reused from a near-identical page (see perform_ocr).
+    """
+    def report(progress, message):
+        if on_progress:
+            on_progress(progress=progress, message=message)
+
     try:
+        report(0.05, "Preprocessing image...")
         processed_image = preprocess_image(image_bytes)
+        if reuse_duplicates and duplicate_index is not None:
+            match = duplicate_index.lookup(processed_image)
+            if match:
+                increment("cache_hits", cache="near_duplicate")
+                return match["text"], None
         headers = {
             "Ocp-Apim-Subscription-Key": AZURE_OCR_KEY,
             "Content-Type": "application/octet-stream"
         }
         read_url = f"{AZURE_OCR_ENDPOINT}/vision/v3.2/read/analyze"
-        response = requests.post(read_url, headers=headers, data=processed_image, timeout=30)
+        report(0.1, "Uploading image to Read API...")
+        increment("bytes_uploaded", len(processed_image), service="ocr")
+        response = limited_request("ocr", AZURE_OCR_KEY, "POST", read_url, stage="ocr_submit",
+                                   headers=headers, data=processed_image, timeout=30)
         
         if response.status_code != 202:
             logger.error(f"Read API error: {response.status_code} - {response.text}")
-            return f"OCR Failed: {response.status_code} - {response.text[:100]}..."
+            return f"OCR Failed: {response.status_code} - {response.text[:100]}...", None
         
         operation_location = response.headers["Operation-Location"]
-        for _ in range(10):
-            response = requests.get(operation_location, headers=headers, timeout=30)
-            if response.status_code == 200:
-                result = response.json()
-                if result["status"] == "succeeded":
-                    extracted_text = "\n".join([
-                        line["text"]
-                        for page in result["analyzeResult"]["readResults"]
-                        for line in page["lines"]
-                    ])
-                    return extracted_text if extracted_text else "No text detected."
-                elif result["status"] == "failed":
-                    logger.error("Read API failed")
-                    return "OCR Failed: Read API processing error"
-            time.sleep(3)
-        return "OCR Failed: Timeout waiting for Read API results"
+        with span("ocr_poll_wait"):
+            for attempt in range(AZURE_OCR_POLL_ATTEMPTS):
+                report(0.2 + 0.7 * attempt / AZURE_OCR_POLL_ATTEMPTS,
+                       f"Waiting for Read API results ({attempt + 1}/{AZURE_OCR_POLL_ATTEMPTS})...")
+                response = limited_request("ocr", AZURE_OCR_KEY, "GET", operation_location, headers=headers, timeout=30)
+                if response.status_code == 200:
+                    result = response.json()
+                    if result["status"] == "succeeded":
+                        extracted_text = "\n".join([
+                            line["text"]
+                            for page in result["analyzeResult"]["readResults"]
+                            for line in page["lines"]
+                        ])
+                        if extracted_text and duplicate_index is not None:
+                            duplicate_index.add(processed_image, extracted_text)
+                        read_results = result["analyzeResult"]["readResults"]
+                        return (extracted_text if extracted_text else "No text detected."), read_results
+                    elif result["status"] == "failed":
+                        logger.error("Read API failed")
+                        return "OCR Failed: Read API processing error", None
+                time.sleep(AZURE_OCR_POLL_INTERVAL)
+        return "OCR Failed: Timeout waiting for Read API results", None
     except Exception as e:
         logger.error(f"Error in OCR processing: {str(e)}")
-        return f"OCR Error: {str(e)}"
+        return f"OCR Error: {str(e)}", None
 
+def perform_ocr(image_bytes, on_progress=None, duplicate_index=None, reuse_duplicates=False):
+    """
+    Perform OCR on image using Azure Read API, reporting progress to on_progress if given.
+    Pages read successfully are added to duplicate_index. Only pass reuse_duplicates once
+    the user has agreed to reuse text from that index instead of calling the Read API.
+    """
+    text, _ = read_document(image_bytes, on_progress=on_progress, duplicate_index=duplicate_index,
+                            reuse_duplicates=reuse_duplicates)
+    return text
+
+@timed("translate")
 def translate_text(text, target_language_code):
     """Translate text using Azure Translator API"""
     try:
@@ -74,7 +119,11 @@ def translate_text(text, target_language_code):
             "Content-Type": "application/json"
         }
         params = {"api-version": "3.0", "to": target_language_code}
-        response = requests.post(
+        increment("bytes_uploaded", len(text.encode("utf-8")), service="translator")
+        response = limited_request(
+            "translator",
+            AZURE_TRANSLATOR_KEY,
+            "POST",
             f"{AZURE_TRANSLATOR_ENDPOINT}/translate",
             headers=headers,
             params=params,
@@ -98,13 +147,49 @@ def home_page():
     if uploaded_file:
         try:
             st.image(uploaded_file, caption="Uploaded Document", use_column_width=True)
-            with st.spinner("Performing OCR on document..."):
-                image_bytes = uploaded_file.read()
-                extracted_text = perform_ocr(image_bytes)
-                if extracted_text and not extracted_text.startswith("OCR Failed") and not extracted_text.startswith("OCR Error"):
-                    st.success("OCR completed successfully!")
+            image_bytes = uploaded_file.getvalue()
+            image_key = hashlib.sha256(image_bytes).hexdigest()
+            # Check once per upload whether this session already OCR'd the page (re-uploaded, re-compressed)
+            ocr_index = get_session_ocr_index()
+            dedup_check = st.session_state.get("dedup_check")
+            if not dedup_check or dedup_check["key"] != image_key:
+                dedup_check = {"key": image_key, "match": ocr_index.lookup(preprocess_image(image_bytes)), "choice": None}
+                st.session_state.dedup_check = dedup_check
+
+            match = dedup_check["match"]
+            if match and dedup_check["choice"] is None:
+                # Never reuse text without asking: a near-identical image can still be a different page
+                st.info(f"This page looks like one you processed earlier ({match['similarity']:.0%} match). "
+                        "Reuse its text or run OCR on this image?")
+                reuse_column, ocr_column = st.columns(2)
+                if reuse_column.button("Use earlier result"):
+                    dedup_check["choice"] = "reuse"
+                    increment("cache_hits", cache="near_duplicate")
+                    st.rerun()
+                if ocr_column.button("Run OCR"):
+                    dedup_check["choice"] = "ocr"
+                    st.rerun()
+                return
+
+            if match and dedup_check["choice"] == "reuse":
+                extracted_text, read_results = match["text"], None
+            else:
+                # OCR runs in the shared job pool; reruns pick up the same job instead of resubmitting
+                job = ensure_job(st.session_state, "ocr_job", image_key, read_document, image_bytes,
+                                 duplicate_index=ocr_index)
+                if not job.done:
+                    st.progress(job.progress, text=job.message or "Performing OCR on document...")
+                    time.sleep(JOB_POLL_INTERVAL)
+                    st.rerun()
+
+                if job.status == FAILED:
+                    extracted_text, read_results = f"OCR Error: {job.error}", None
                 else:
-                    st.warning("OCR processing encountered issues. Try a higher quality image.")
+                    extracted_text, read_results = job.result
+            if extracted_text and not extracted_text.startswith("OCR Failed") and not extracted_text.startswith("OCR Error"):
+                st.success("OCR completed successfully!")
+            else:
+                st.warning("OCR processing encountered issues. Try a higher quality image.")
             
             st.subheader("Recognized Text")
             text_area = st.text_area("Edit the extracted text if needed:", extracted_text, height=200)
@@ -145,7 +230,7 @@ def home_page():
             col1, col2 = st.columns(2)
             
             with col1:
-                export_format = st.selectbox("Select export format", ["PDF", "Word", "Image", "Markdown", "Text"])
+                export_format = st.selectbox("Select export format", ["PDF", "Searchable PDF", "Word", "Image", "Markdown", "Text"])
             
             with col2:
                 pdf_header = None
@@ -161,6 +246,10 @@ def home_page():
                             if export_format == "PDF":
                                 pdf_bytes = generate_pdf(translated_text, header=pdf_header, footer=pdf_footer)
                                 st.download_button("Download PDF", pdf_bytes, "output.pdf", "application/pdf")
+                            elif export_format == "Searchable PDF":
+                                # Original scan with the OCR text as an invisible, selectable layer
+                                pdf_bytes = generate_searchable_pdf([(image_bytes, read_results, text_area)])
+                                st.download_button("Download Searchable PDF", pdf_bytes, "output_searchable.pdf", "application/pdf")
                             elif export_format == "Word":
                                 word_bytes = generate_word(translated_text)
                                 st.download_button("Download Word", word_bytes, "output.docx", 
@@ -0,0 +1,326 @@
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_EXPORT, METRICS_PORT, PROFILE_MODE, PROFILE_DIR
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Upper bounds in seconds; covers fast exports through slow Read API polling
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line, including span fields"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging():
+    """Configure root logging once for the whole process"""
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        if METRICS_EXPORT == "json":
+            handler = logging.StreamHandler()
+            handler.setFormatter(JsonFormatter())
+            logging.basicConfig(level=logging.INFO, handlers=[handler])
+        else:
+            logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+        _logging_configured = True
+
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Thread-safe store of per-stage histograms and labelled counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # stage -> Histogram
+        self._counters = {}  # (name, sorted label items) -> value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Return all metrics as a JSON-serialisable dict"""
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {"count": h.count, "sum": round(h.sum, 6),
+                            "buckets": {str(bound): total for bound, total in h.cumulative()}}
+                    for stage, h in self._histograms.items()
+                },
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self._counters.items()
+                ],
+            }
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            if self._histograms:
+                lines.append("# HELP docdigitizer_stage_duration_seconds Time spent per pipeline stage")
+                lines.append("# TYPE docdigitizer_stage_duration_seconds histogram")
+            for stage, h in sorted(self._histograms.items()):
+                for bound, total in h.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'docdigitizer_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {total}')
+                lines.append(f'docdigitizer_stage_duration_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'docdigitizer_stage_duration_seconds_count{{stage="{stage}"}} {h.count}')
+
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"docdigitizer_{name}_total"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} counter")
+                    typed.add(metric)
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def increment(name, value=1, **labels):
+    """Add value to a counter, e.g. increment("cache_hits", cache="ocr_job")"""
+    registry.increment(name, value, **labels)
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time a pipeline stage and record it in the stage histogram"""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe(stage, elapsed)
+        if failed:
+            registry.increment("stage_errors", stage=stage)
+        if METRICS_EXPORT == "json":
+            logger.info(f"span {stage}", extra={"fields": {
+                "event": "span", "stage": stage, "duration": round(elapsed, 6), "failed": failed, **fields
+            }})
+
+
+def timed(stage):
+    """Decorator form of span() for timing a whole function"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics (Prometheus) and /metrics.json on port in a daemon thread, once per process"""
+    global _server
+    with _server_lock:
+        if _server is not None or METRICS_EXPORT != "prometheus":
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {port}: {str(e)}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Metrics available at http://localhost:{port}/metrics")
+        return _server
+
+
+# cProfile: one profiler may run at a time, so concurrent blocks run unprofiled rather
+# than fail. Each block's stats are merged per name and written out at most every
+# PROFILE_DUMP_INTERVAL seconds (and at exit) instead of one file per block.
+PROFILE_DUMP_INTERVAL = 60
+_cprofile_lock = threading.Lock()
+_cprofile_stats = {}  # name -> pstats.Stats
+_cprofile_dumped = {}  # name -> time of last dump
+_cprofile_stats_lock = threading.Lock()
+
+# tracemalloc is process-wide: count overlapping blocks and stop tracing only when the last one exits
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _profile_path(name):
+    return os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}.prof")
+
+
+def dump_profiles():
+    """Write the merged cProfile stats for every profiled name"""
+    with _cprofile_stats_lock:
+        if not _cprofile_stats:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        for name, stats in _cprofile_stats.items():
+            stats.dump_stats(_profile_path(name))
+            _cprofile_dumped[name] = time.monotonic()
+
+
+def _record_cprofile(name, profiler):
+    with _cprofile_stats_lock:
+        stats = _cprofile_stats.get(name)
+        if stats is None:
+            _cprofile_stats[name] = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+        due = time.monotonic() - _cprofile_dumped.get(name, 0.0) >= PROFILE_DUMP_INTERVAL
+        if due:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            _cprofile_stats[name].dump_stats(_profile_path(name))
+            _cprofile_dumped[name] = time.monotonic()
+    if due:
+        logger.info(f"cProfile stats for {name} written to {_profile_path(name)}")
+
+
+@contextmanager
+def _cprofile_block(name):
+    if not _cprofile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _record_cprofile(name, profiler)
+    finally:
+        _cprofile_lock.release()
+
+
+@contextmanager
+def _tracemalloc_block(name):
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+    try:
+        yield
+    finally:
+        with _tracemalloc_lock:
+            # Snapshot while holding the lock so no other block can stop tracing first
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and _tracemalloc_owned:
+                tracemalloc.stop()
+                _tracemalloc_owned = False
+        top = "\n".join(str(stat) for stat in snapshot.statistics("lineno")[:10])
+        logger.info(f"tracemalloc {name}: current={current} peak={peak} bytes\n{top}")
+
+
+@contextmanager
+def profiled(name):
+    """Profile the block with cProfile or tracemalloc when PROFILE_MODE selects one"""
+    if PROFILE_MODE == "cprofile":
+        with _cprofile_block(name):
+            yield
+    elif PROFILE_MODE == "tracemalloc":
+        with _tracemalloc_block(name):
+            yield
+    else:
+        yield
+
+
+if PROFILE_MODE == "cprofile":
+    atexit.register(dump_profiles)
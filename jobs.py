@@ -0,0 +1,164 @@
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import configure_logging, increment, profiled
+from config import JOB_WORKERS, JOB_RESULT_TTL
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    """A unit of background work with progress, partial results and a final result"""
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.partial = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def report(self, progress=None, message=None, partial=None):
+        """Progress callback handed to the job function; safe to call from any thread"""
+        with self._lock:
+            if progress is not None:
+                self.progress = min(max(float(progress), 0.0), 1.0)
+            if message is not None:
+                self.message = message
+            if partial is not None:
+                self.partial = partial
+
+
+class JobManager:
+    """Process-wide thread pool shared by all Streamlit sessions"""
+
+    def __init__(self, max_workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.result_ttl = result_ttl
+
+    def submit(self, label, func, *args, **kwargs):
+        """Run func(*args, on_progress=job.report, **kwargs) in the pool and return the job ID"""
+        job = Job(label)
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job.id] = job
+        # Carry the submitter's context (e.g. its rate-limit client ID) into the pool thread
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run, job, func, args, kwargs)
+        return job.id
+
+    def get(self, job_id):
+        """Return the job for job_id, or None if it is unknown or has expired"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = RUNNING
+        try:
+            # The real work of OCR/transcription pages happens here, not in the page rerun
+            with profiled(f"job_{job.label}"):
+                job.result = func(*args, on_progress=job.report, **kwargs)
+            job.report(progress=1.0)
+            job.status = SUCCEEDED
+        except Exception as e:
+            logger.error(f"Background job {job.label} failed: {str(e)}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _evict_expired(self):
+        """Drop finished jobs nobody collected within result_ttl seconds"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-level JobManager, creating it on first use"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def _lookup(session_state, slot):
+    """
+    Return the job for session_state[slot], or None. A finished job is moved out of the
+    shared manager into the session itself, so result_ttl eviction can never make a
+    page that still shows the result resubmit (and pay for) the same work.
+    """
+    entry = session_state.get(slot)
+    if not entry:
+        return None
+    if "job" in entry:
+        return entry["job"]
+    manager = get_job_manager()
+    job = manager.get(entry["job_id"])
+    if job is not None and job.done:
+        entry["job"] = job
+        manager.forget(job.id)
+        # Counted once per job; later reruns read the session copy without counting again
+        increment("cache_hits", cache=slot)
+    return job
+
+
+def ensure_job(session_state, slot, key, func, *args, force=False, **kwargs):
+    """
+    Return the job stored under session_state[slot], submitting it first if needed.
+    A new job is submitted when the slot is empty, when its key differs (e.g. a new
+    upload), when an unfinished job was lost, or when force is set; otherwise the
+    existing job is reused so Streamlit reruns never repeat finished work.
+    """
+    entry = session_state.get(slot)
+    job = _lookup(session_state, slot)
+    if force or job is None or entry["key"] != key:
+        manager = get_job_manager()
+        job_id = manager.submit(slot, func, *args, **kwargs)
+        session_state[slot] = {"job_id": job_id, "key": key}
+        job = manager.get(job_id)
+    return job
+
+
+def active_job(session_state, slot):
+    """Return the job stored under session_state[slot] without submitting anything"""
+    return _lookup(session_state, slot)
+
+
+def clear_job(session_state, slot):
+    """Forget the job in session_state[slot] once its result has been consumed"""
+    entry = session_state.pop(slot, None)
+    if entry:
+        get_job_manager().forget(entry["job_id"])
@@ -0,0 +1,200 @@
+import argparse
+import json
+import logging
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Standalone on purpose: benchmark.py starts this server before config.py is imported
+logger = logging.getLogger(__name__)
+
+READ_ANALYZE_PATH = "/vision/v3.2/read/analyze"
+READ_RESULTS_PATH = re.compile(r"^/vision/v3\.2/read/analyzeResults/([0-9a-f]+)$")
+TRANSLATE_PATH = "/translate"
+
+
+def _png_size(data):
+    """Read width and height from a PNG header, falling back to 1024x1024"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    return 1024, 1024
+
+
+def _box(x, y, width, height):
+    """Azure-style 8-number bounding polygon (clockwise from top-left)"""
+    return [x, y, x + width, y, x + width, y + height, x, y + height]
+
+
+def fake_read_result(width, height, line_count):
+    """Build a Read API analyzeResult with line and word bounding boxes"""
+    lines = []
+    line_height = max(height // (line_count + 2), 1)
+    for i in range(line_count):
+        words = [f"line{i + 1}", "mock", "handwritten", "text"]
+        y = line_height * (i + 1)
+        x = width // 20
+        word_boxes = []
+        for word in words:
+            word_width = max(len(word) * line_height // 2, 1)
+            word_boxes.append({"boundingBox": _box(x, y, word_width, line_height), "text": word, "confidence": 0.99})
+            x += word_width + line_height // 2
+        lines.append({
+            "boundingBox": _box(width // 20, y, x - width // 20, line_height),
+            "text": " ".join(words),
+            "words": word_boxes,
+        })
+    return {
+        "version": "3.2.0",
+        "readResults": [{"page": 1, "angle": 0, "width": width, "height": height, "unit": "pixel", "lines": lines}],
+    }
+
+
+class MockAzureState:
+    """Latency, throttling and pending-operation state shared by all handler threads"""
+
+    def __init__(self, ocr_latency=1.0, translate_latency=0.05, throttle_rate=0.0, retry_after=1, line_count=20):
+        self.ocr_latency = ocr_latency
+        self.translate_latency = translate_latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.line_count = line_count
+        self.operations = {}
+        self.lock = threading.Lock()
+        self.random = random.Random(0)
+
+    def should_throttle(self):
+        with self.lock:
+            return self.random.random() < self.throttle_rate
+
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _path(self):
+        return re.sub(r"/{2,}", "/", urlparse(self.path).path)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _throttled(self):
+        if not self.state.should_throttle():
+            return False
+        self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                        {"Retry-After": str(self.state.retry_after)})
+        return True
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self):
+        path = self._path()
+        body = self._read_body()
+        if self._throttled():
+            return
+        if path == READ_ANALYZE_PATH:
+            width, height = _png_size(body)
+            operation_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.operations[operation_id] = (time.monotonic() + self.state.ocr_latency, width, height)
+            host = self.headers.get("Host", f"127.0.0.1:{self.server.server_port}")
+            location = f"http://{host}/vision/v3.2/read/analyzeResults/{operation_id}"
+            self.send_response(202)
+            self.send_header("Operation-Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == TRANSLATE_PATH:
+            target = parse_qs(urlparse(self.path).query).get("to", ["en"])[0]
+            time.sleep(self.state.translate_latency)
+            items = json.loads(body or b"[]")
+            self._send_json(200, [
+                {"translations": [{"text": f"[{target}] {item.get('text', '')}", "to": target}]}
+                for item in items
+            ])
+        else:
+            self._send_json(404, {"error": {"code": "404", "message": f"Unknown path {path}"}})
+
+    def do_GET(self):
+        path = self._path()
+        match = READ_RESULTS_PATH.match(path)
+        if not match:
+            self._send_json(404, {"error": {"code": "404", "message": f"Unknown path {path}"}})
+            return
+        if self._throttled():
+            return
+        with self.state.lock:
+            operation = self.state.operations.get(match.group(1))
+        if operation is None:
+            self._send_json(404, {"error": {"code": "404", "message": "Unknown operation"}})
+            return
+        ready_at, width, height = operation
+        if time.monotonic() < ready_at:
+            self._send_json(200, {"status": "running"})
+            return
+        with self.state.lock:
+            self.state.operations.pop(match.group(1), None)
+        self._send_json(200, {
+            "status": "succeeded",
+            "analyzeResult": fake_read_result(width, height, self.state.line_count),
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """Start the mock server in a daemon thread and return (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), MockAzureHandler)
+    server.daemon_threads = True
+    server.state = MockAzureState(**options)
+    threading.Thread(target=server.serve_forever, name="mock-azure", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Azure Read and Translator APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ocr-latency", type=float, default=1.0, help="Seconds before a Read operation succeeds")
+    parser.add_argument("--translate-latency", type=float, default=0.05, help="Seconds per /translate call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--lines", type=int, default=20, help="Text lines returned per Read result")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server, base_url = start_mock_server(
+        args.host, args.port,
+        ocr_latency=args.ocr_latency,
+        translate_latency=args.translate_latency,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        line_count=args.lines,
+    )
+    logger.info(f"Mock Azure listening on {base_url}")
+    logger.info(f"Set AZURE_OCR_ENDPOINT={base_url} and AZURE_TRANSLATOR_ENDPOINT={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
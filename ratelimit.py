@@ -0,0 +1,207 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import requests
+from instrumentation import configure_logging, span, increment
+from config import RATE_LIMITS, RATE_LIMIT_MAX_RETRIES
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+_client = contextvars.ContextVar("ratelimit_client", default=None)
+_priority = contextvars.ContextVar("ratelimit_priority", default=PRIORITY_INTERACTIVE)
+
+
+def bind_client(client, priority=PRIORITY_INTERACTIVE):
+    """Tag Azure calls made from the current context with a client ID and priority"""
+    _client.set(client)
+    _priority.set(priority)
+
+
+@contextmanager
+def request_context(client=None, priority=PRIORITY_INTERACTIVE):
+    """Temporarily tag Azure calls with a client ID and priority"""
+    client_token = _client.set(client)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _client.reset(client_token)
+        _priority.reset(priority_token)
+
+
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out tokens in priority order and round-robin across
+    clients within a priority, so one busy session cannot starve the others.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._queues = {}  # priority -> OrderedDict(client -> deque of tickets)
+        self._cond = threading.Condition()
+
+    def acquire(self, client=None, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Block until a token is granted; return False if timeout elapses first"""
+        ticket = _Ticket()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            clients = self._queues.setdefault(priority, OrderedDict())
+            clients.setdefault(client, deque()).append(ticket)
+            while True:
+                now = time.monotonic()
+                self._dispatch(now)
+                if ticket.granted:
+                    return True
+                wait = self._next_wakeup(now)
+                if deadline is not None:
+                    if now >= deadline:
+                        self._discard(priority, client, ticket)
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def defer(self, seconds):
+        """Pause all grants for seconds, e.g. after the service returned Retry-After"""
+        with self._cond:
+            self._refill(time.monotonic())
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            # Drop the saved-up burst so waiters don't stampede when the pause ends
+            self._tokens = 0.0
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        # Tokens only accumulate outside a Retry-After pause
+        start = max(self._updated, self._blocked_until)
+        if now > start:
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def _dispatch(self, now):
+        """Grant tokens to queued tickets while the bucket allows"""
+        self._refill(now)
+        if now < self._blocked_until:
+            return
+        granted = False
+        while self._tokens >= 1.0:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._tokens -= 1.0
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _next_ticket(self):
+        for priority in sorted(self._queues):
+            clients = self._queues[priority]
+            if not clients:
+                continue
+            client, tickets = next(iter(clients.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            return ticket
+        return None
+
+    def _next_wakeup(self, now):
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        return max((1.0 - self._tokens) / self.rate, 0.001)
+
+    def _discard(self, priority, client, ticket):
+        tickets = self._queues.get(priority, {}).get(client)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[priority][client]
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(service, key=""):
+    """Return the process-wide bucket for a service and subscription key"""
+    with _limiters_lock:
+        limiter = _limiters.get((service, key))
+        if limiter is None:
+            rate, burst = RATE_LIMITS[service]
+            limiter = TokenBucket(rate, burst)
+            _limiters[(service, key)] = limiter
+        return limiter
+
+
+def acquire(service, key="", timeout=None):
+    """Wait for a token for service using the caller's client ID and priority"""
+    return get_limiter(service, key).acquire(_client.get(), _priority.get(), timeout=timeout)
+
+
+def defer_after_throttling(service, key, delay):
+    """Count a throttled call and pause the service's bucket for delay seconds before it is retried"""
+    increment("retries", service=service)
+    logger.warning(f"{service} throttled (429), retrying in {delay:.1f}s")
+    get_limiter(service, key).defer(delay)
+
+
+def _retry_after_seconds(response, attempt):
+    """Parse retry-after-ms or Retry-After (seconds or HTTP date), else back off exponentially"""
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000.0, 0.0)
+        except ValueError:
+            pass
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return float(2 ** attempt)
+
+
+def limited_request(service, key, method, url, stage=None, **kwargs):
+    """
+    Send an HTTP request through the service's shared token bucket.
+    429 responses pause the bucket for Retry-After and the request is retried
+    up to RATE_LIMIT_MAX_RETRIES times before the last response is returned.
+    Each HTTP call alone is timed under stage (default "<service>_request"),
+    separately from the time spent waiting in "ratelimit_wait".
+    """
+    limiter = get_limiter(service, key)
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        with span("ratelimit_wait", service=service):
+            limiter.acquire(_client.get(), _priority.get())
+        with span(stage or f"{service}_request", service=service):
+            response = requests.request(method, url, **kwargs)
+        if response.status_code != 429 or attempt == RATE_LIMIT_MAX_RETRIES:
+            return response
+        defer_after_throttling(service, key, _retry_after_seconds(response, attempt))
+    return response
@@ -1,13 +1,17 @@
 import pdfkit
+import fitz  # PyMuPDF
+import math
+import itertools
 from docx import Document
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
 import os
 import logging
-from config import WKHTMLTOPDF_PATH
+from config import WKHTMLTOPDF_PATH, SEARCHABLE_PDF_DPI, SEARCHABLE_PDF_FONT_FILE
+from instrumentation import configure_logging, timed
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
 def get_pdfkit_config():
@@ -18,6 +22,7 @@ def get_pdfkit_config():
         logger.warning(f"wkhtmltopdf not found at {WKHTMLTOPDF_PATH}, using system PATH")
         return None
 
+@timed("export_pdf")
 def generate_pdf(text, header=None, footer=None):
     """Generate PDF from HTML text with optional header and footer"""
     try:
@@ -51,6 +56,262 @@ def generate_pdf(text, header=None, footer=None):
         logger.error(f"Error generating PDF: {str(e)}")
         raise Exception(f"Failed to generate PDF: {str(e)}")
 
+_SPACE_WIDTH = fitz.Font("helv").text_length(" ", fontsize=1)
+
+def _noto_script(codepoint):
+    """MuPDF (UCDN) script number of the built-in Noto font for a code point, or None"""
+    if 0x0590 <= codepoint < 0x0600:
+        return 5  # Hebrew
+    if 0x0600 <= codepoint < 0x0700:
+        return 6  # Arabic
+    if 0x0900 <= codepoint < 0x1000:
+        # Devanagari through Tibetan occupy consecutive 128-code-point blocks in UCDN order
+        return 9 + (codepoint - 0x0900) // 0x80
+    return None
+
+class _TextLayerFonts:
+    """
+    Fonts for the invisible text layer, chosen per word: the configured font file,
+    Helvetica for Latin-1, then MuPDF's built-in Noto fonts and Droid Sans Fallback
+    (CJK and Hangul) so non-Latin words stay searchable instead of turning into dots.
+    """
+
+    def __init__(self):
+        self.chain = []
+        if SEARCHABLE_PDF_FONT_FILE and os.path.exists(SEARCHABLE_PDF_FONT_FILE):
+            self.chain.append(("ocrfont", SEARCHABLE_PDF_FONT_FILE, fitz.Font(fontfile=SEARCHABLE_PDF_FONT_FILE)))
+        self.chain.append(("helv", None, fitz.Font("helv")))
+        self.chain.append(("noto", None, fitz.Font(script=1)))
+        self.cjk = ("cjk", None, fitz.Font("cjk"))
+        self._scripts = {}
+        self._inserted = set()
+        self._first_pages = {}
+
+    @staticmethod
+    def _covers(spec, chars):
+        fontname, _, font = spec
+        if fontname == "helv":
+            # Base-14 fonts are written with a single-byte encoding
+            return all(ord(char) < 256 for char in chars)
+        return all(font.has_glyph(ord(char)) for char in chars)
+
+    def _script_font(self, chars):
+        for char in chars:
+            script = _noto_script(ord(char))
+            if script is not None:
+                if script not in self._scripts:
+                    try:
+                        self._scripts[script] = (f"noto{script}", None, fitz.Font(script=script))
+                    except Exception as e:
+                        logger.warning(f"No built-in font for script {script}: {str(e)}")
+                        self._scripts[script] = None
+                return self._scripts[script]
+        return None
+
+    def for_text(self, text):
+        """Return (fontname, fontfile, font) for the first font with glyphs for all of text"""
+        chars = [char for char in text if not char.isspace()]
+        candidates = list(self.chain)
+        script_spec = self._script_font(chars)
+        if script_spec:
+            candidates.append(script_spec)
+        candidates.append(self.cjk)
+        for spec in candidates:
+            if self._covers(spec, chars):
+                return spec
+        return max(candidates, key=lambda spec: sum(self._covers(spec, [char]) for char in chars))
+
+    def insert_text(self, shape, point, text, spec, fontsize, morph=None):
+        """Write text with render mode 3 (invisible), embedding built-in fonts on first use per page"""
+        fontname, fontfile, font = spec
+        page = shape.page
+        if fontfile is None and fontname != "helv" and (page.xref, fontname) not in self._inserted:
+            self._embed(page, fontname, font)
+            self._inserted.add((page.xref, fontname))
+        shape.insert_text(point, text, fontsize=fontsize, fontname=fontname, fontfile=fontfile,
+                          render_mode=3, morph=morph)
+
+    def _embed(self, page, fontname, font):
+        doc = page.parent
+        first_page = self._first_pages.get(fontname)
+        if first_page is not None:
+            # Point at the copy an earlier page of this document embedded
+            for xref, _, _, _, refname, *_ in doc[first_page].get_fonts():
+                if refname == fontname:
+                    # xref_set_key cannot write through indirect objects, so follow them by hand
+                    target, keys = page.xref, []
+                    for key in ("Resources", "Font"):
+                        keys.append(key)
+                        kind, value = doc.xref_get_key(target, "/".join(keys))
+                        if kind == "xref":
+                            target, keys = int(value.split()[0]), []
+                    doc.xref_set_key(target, "/".join(keys + [fontname]), f"{xref} 0 R")
+                    return
+        page.insert_font(fontname=fontname, fontbuffer=font.buffer)
+        self._first_pages[fontname] = page.number
+
+def _layout_textbox(rect, paragraphs, fontsize, line_spacing=1.2):
+    """
+    Flow paragraphs of (word, spec, width at 1pt) into rect as (point, run, spec) runs of same-font words.
+    Returns (runs, fits); fits is False when lines run past the bottom or a word is wider than rect.
+    """
+    space = _SPACE_WIDTH * fontsize
+    runs = []
+    fits = True
+    line = 0
+    for paragraph in paragraphs:
+        x = 0.0
+        run = None
+        for word, spec, unit_width in paragraph:
+            width = unit_width * fontsize
+            if x and x + space + width > rect.width:
+                line += 1
+                x = 0.0
+                run = None
+            if width > rect.width:
+                fits = False
+            if run is not None and run[2] == spec:
+                run[1] += " " + word
+            else:
+                if run is not None:
+                    # A real space glyph, so extraction doesn't glue words in different fonts together
+                    run[1] += " "
+                offset = x + space if x else x
+                run = [fitz.Point(rect.x0 + offset, rect.y0 + fontsize + line * fontsize * line_spacing), word, spec]
+                runs.append(run)
+            x = (x + space if x else x) + width
+        line += 1
+    if rect.y0 + fontsize + (line - 1) * fontsize * line_spacing > rect.y1:
+        fits = False
+    return runs, fits
+
+def _insert_invisible_textbox(shape, rect, text, fonts, fontsize=10, min_fontsize=1):
+    """Flow text invisibly into rect, shrinking the font until all of it fits"""
+    paragraphs = []
+    for paragraph in text.splitlines():
+        words = []
+        for word in paragraph.split():
+            spec = fonts.for_text(word)
+            words.append((word, spec, spec[2].text_length(word, fontsize=1)))
+        paragraphs.append(words)
+    runs, fits = _layout_textbox(rect, paragraphs, fontsize)
+    while not fits and fontsize > min_fontsize:
+        fontsize = max(fontsize * 0.8, min_fontsize)
+        runs, fits = _layout_textbox(rect, paragraphs, fontsize)
+    if not fits:
+        logger.warning(f"Text layer overflows the page even at {min_fontsize}pt; writing it anyway")
+    for point, run, spec in runs:
+        fonts.insert_text(shape, point, run, spec, fontsize)
+
+def _insert_invisible_text(shape, polygon, text, scale_x, scale_y, fonts):
+    """Place text invisibly (render mode 3) so it covers the Read API bounding polygon"""
+    # Read API polygons run clockwise from the top-left corner
+    x0, y0, x1, y1 = polygon[0] * scale_x, polygon[1] * scale_y, polygon[2] * scale_x, polygon[3] * scale_y
+    x3, y3 = polygon[6] * scale_x, polygon[7] * scale_y
+    width = math.hypot(x1 - x0, y1 - y0)
+    height = math.hypot(x3 - x0, y3 - y0)
+    if not text.strip() or width <= 0 or height <= 0:
+        return
+    spec = fonts.for_text(text)
+    fontsize = height * 0.9
+    text_width = spec[2].text_length(text, fontsize=fontsize)
+    if text_width <= 0:
+        return
+    angle = math.degrees(math.atan2(y1 - y0, x1 - x0))
+    origin = fitz.Point(x3, y3)
+    # Stretch the word to the box width, then follow the line's slant
+    morph = (origin, fitz.Matrix(width / text_width, 1) * fitz.Matrix(angle))
+    # A trailing space glyph past the box, so extraction doesn't glue neighbouring words together
+    fonts.insert_text(shape, origin, text + " ", spec, fontsize, morph=morph)
+
+def _add_searchable_page(doc, image_bytes, read_results, fallback_text, fonts):
+    """Append one page: the original image with an invisible OCR text layer on top"""
+    image = Image.open(BytesIO(image_bytes))
+    dpi = image.info.get("dpi", (SEARCHABLE_PDF_DPI,))[0] or SEARCHABLE_PDF_DPI
+    # Many phone photos claim 72 dpi, which would make enormous pages
+    dpi = dpi if dpi >= 100 else SEARCHABLE_PDF_DPI
+    width_pt = image.width * 72.0 / dpi
+    height_pt = image.height * 72.0 / dpi
+    image.close()
+
+    page = doc.new_page(width=width_pt, height=height_pt)
+    page.insert_image(page.rect, stream=image_bytes)
+    # One shape per page: every page.insert_text call would append and re-scan a content stream
+    shape = page.new_shape()
+
+    if read_results:
+        for result in read_results:
+            # Coordinates refer to the image the Read API received, which preprocess_image may have downscaled
+            scale_x = width_pt / result["width"]
+            scale_y = height_pt / result["height"]
+            for line in result.get("lines", []):
+                words = line.get("words") or [{"boundingBox": line["boundingBox"], "text": line["text"]}]
+                for word in words:
+                    _insert_invisible_text(shape, word["boundingBox"], word["text"], scale_x, scale_y, fonts)
+    elif fallback_text:
+        # No layout available (e.g. reused result): keep the text searchable, without positions
+        _insert_invisible_textbox(shape, page.rect + (20, 20, -20, -20), fallback_text, fonts)
+    shape.commit()
+
+def _searchable_document(pages):
+    """In-memory searchable PDF of (image_bytes, read_results, fallback_text) pages, with subset fonts"""
+    doc = fitz.open()
+    fonts = _TextLayerFonts()
+    for image_bytes, read_results, fallback_text in pages:
+        _add_searchable_page(doc, image_bytes, read_results, fallback_text, fonts)
+    if doc.page_count:
+        try:
+            # Fallback fonts are embedded whole (Droid Sans Fallback is ~3.5 MB)
+            doc.subset_fonts()
+        except Exception as e:
+            logger.warning(f"Could not subset text layer fonts: {str(e)}")
+    return doc
+
+@timed("export_searchable_pdf")
+def generate_searchable_pdf(pages, output_path=None, flush_every=10):
+    """
+    Generate a searchable PDF from (image_bytes, read_results, fallback_text) pages.
+    Without output_path the PDF bytes are returned. With output_path, pages are built
+    flush_every at a time and appended to the file with an incremental save, so long
+    batches never hold the whole document in memory.
+    """
+    try:
+        if output_path is None:
+            doc = _searchable_document(pages)
+            if doc.page_count == 0:
+                raise ValueError("No pages to write")
+            pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+            doc.close()
+            return pdf_bytes
+
+        pages = iter(pages)
+        written = 0
+        while True:
+            # Each chunk subsets its own fonts; sharing them with pages already on disk
+            # would either embed them whole or drop glyphs that later pages need
+            chunk = _searchable_document(itertools.islice(pages, flush_every))
+            if chunk.page_count == 0:
+                chunk.close()
+                break
+            if written:
+                # Opening parses lazily from disk, so the flushed pages' image data stays there
+                doc = fitz.open(output_path)
+                doc.insert_pdf(chunk)
+                # saveIncr() would append the new pages' images uncompressed
+                doc.save(output_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+                doc.close()
+            else:
+                chunk.save(output_path, garbage=3, deflate=True)
+            written += chunk.page_count
+            chunk.close()
+        if not written:
+            raise ValueError("No pages to write")
+        return output_path
+    except Exception as e:
+        logger.error(f"Error generating searchable PDF: {str(e)}")
+        raise Exception(f"Failed to generate searchable PDF: {str(e)}")
+
+@timed("export_docx")
 def generate_word(text):
     """Generate Word document from text"""
     try:
@@ -64,6 +325,7 @@ def generate_word(text):
         logger.error(f"Error generating Word document: {str(e)}")
         raise Exception(f"Failed to generate Word document: {str(e)}")
 
+@timed("export_image")
 def generate_image(text, width=800, height=600, font_size=20):
     """Generate image from text with improved formatting"""
     try:
@@ -109,6 +371,7 @@ def generate_image(text, width=800, height=600, font_size=20):
         logger.error(f"Error generating image: {str(e)}")
         raise Exception(f"Failed to generate image: {str(e)}")
 
+@timed("export_markdown")
 def generate_markdown(text):
     """Generate Markdown file from text"""
     try:
@@ -119,6 +382,7 @@ def generate_markdown(text):
         logger.error(f"Error generating Markdown: {str(e)}")
         raise Exception(f"Failed to generate Markdown: {str(e)}")
 
+@timed("export_text")
 def generate_text(text):
     """Generate plain text file from text"""
     try:
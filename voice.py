@@ -2,14 +2,17 @@ import streamlit as st
 import os
 import logging
 import time
+import hashlib
 import azure.cognitiveservices.speech as speechsdk
-import requests
 from datetime import datetime
 from utils import generate_pdf, generate_word, generate_image
-from config import AZURE_TRANSLATOR_KEY, AZURE_TRANSLATOR_ENDPOINT, AZURE_TRANSLATOR_REGION, LANGUAGES
+from jobs import ensure_job, active_job, clear_job, FAILED
+from ratelimit import limited_request, acquire, defer_after_throttling
+from instrumentation import configure_logging, span, timed, increment
+from config import AZURE_TRANSLATOR_KEY, AZURE_TRANSLATOR_ENDPOINT, AZURE_TRANSLATOR_REGION, LANGUAGES, JOB_POLL_INTERVAL, RATE_LIMIT_MAX_RETRIES
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Azure-supported language codes
@@ -21,10 +24,11 @@ AZURE_SUPPORTED_LANGUAGES = {
     "German": "de-DE",
 }
 
-def transcribe_audio(file_path, language="en-US"):
+def transcribe_audio(file_path, language="en-US", on_progress=None):
     """
     Transcribe a short audio file using Azure Speech recognize_once().
-    Best for files under ~2 minutes.
+    Best for files under ~2 minutes. Intermediate hypotheses are reported
+    to on_progress as partial results when it is given.
     """
     if not os.path.exists(file_path):
         return f"Error: File not found - {file_path}"
@@ -43,10 +47,27 @@ def transcribe_audio(file_path, language="en-US"):
         speech_config = speechsdk.SpeechConfig(subscription=subscription_key, region=region)
         speech_config.speech_recognition_language = language
 
-        audio_config = speechsdk.audio.AudioConfig(filename=file_path)
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            # A fresh recognizer per attempt so a retry reads the audio from the start
+            audio_config = speechsdk.audio.AudioConfig(filename=file_path)
+            speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
+            if on_progress:
+                on_progress(progress=0.1, message="Transcribing audio...")
+                speech_recognizer.recognizing.connect(
+                    lambda evt: on_progress(partial=evt.result.text)
+                )
+
+            acquire("speech", subscription_key)
+            increment("bytes_uploaded", os.path.getsize(file_path), service="speech")
+            with span("transcribe"):
+                result = speech_recognizer.recognize_once()
 
-        result = speech_recognizer.recognize_once()
+            # The SDK reports HTTP 429 as a cancellation; back off through the shared bucket like limited_request
+            throttled = (result.reason == speechsdk.ResultReason.Canceled
+                         and result.cancellation_details.code == speechsdk.CancellationErrorCode.TooManyRequests)
+            if not throttled or attempt == RATE_LIMIT_MAX_RETRIES:
+                break
+            defer_after_throttling("speech", subscription_key, float(2 ** attempt))
 
         if result.reason == speechsdk.ResultReason.RecognizedSpeech:
             return result.text
@@ -61,6 +82,7 @@ def transcribe_audio(file_path, language="en-US"):
     except Exception as e:
         return f"Exception during transcription: {str(e)}"
 
+@timed("translate")
 def translate_text_azure(text, target_lang="en"):
     """Translate text using Azure Translator API."""
     try:
@@ -71,7 +93,11 @@ def translate_text_azure(text, target_lang="en"):
         }
         params = {"api-version": "3.0", "to": target_lang}
         body = [{"text": text}]
-        response = requests.post(
+        increment("bytes_uploaded", len(text.encode("utf-8")), service="translator")
+        response = limited_request(
+            "translator",
+            AZURE_TRANSLATOR_KEY,
+            "POST",
             AZURE_TRANSLATOR_ENDPOINT + "/translate",
             headers=headers,
             params=params,
@@ -105,9 +131,15 @@ def voice_page():
 
     if uploaded_file:
         os.makedirs("temp_audio", exist_ok=True)
-        file_path = f"temp_audio/{uploaded_file.name}"
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # One stable file per session and upload: reruns must not rewrite it while a job reads it,
+        # and another session uploading the same file name must not share it
+        digest = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()[:16]
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        file_path = f"temp_audio/{st.session_state.get('client_id', 'local')}-{digest}{extension}"
+        if not os.path.exists(file_path):
+            with open(f"{file_path}.part", "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            os.replace(f"{file_path}.part", file_path)
 
         st.session_state.audio_file = file_path
         st.subheader("Audio Playback")
@@ -122,13 +154,27 @@ def voice_page():
         transcription_lang_code = AZURE_SUPPORTED_LANGUAGES[transcription_language]
 
         if st.button("📝 Convert to Text"):
-            with st.spinner("Transcribing audio..."):
-                result = transcribe_audio(file_path, language=transcription_lang_code)
-                if result and not result.startswith(("Error", "Recognition canceled", "No speech")):
-                    st.session_state.recognized_text = result
-                    st.success("Transcription completed!")
-                else:
-                    st.error(result)
+            ensure_job(
+                st.session_state, "transcription_job", (file_path, transcription_lang_code),
+                transcribe_audio, file_path, language=transcription_lang_code, force=True
+            )
+
+        # Transcription runs in the shared job pool; poll it across reruns until it finishes
+        job = active_job(st.session_state, "transcription_job")
+        if job and not job.done:
+            st.progress(job.progress, text=job.message or "Transcribing audio...")
+            if job.partial:
+                st.caption(job.partial)
+            time.sleep(JOB_POLL_INTERVAL)
+            st.rerun()
+        elif job:
+            result = f"Error: {job.error}" if job.status == FAILED else job.result
+            clear_job(st.session_state, "transcription_job")
+            if result and not result.startswith(("Error", "Exception", "Recognition canceled", "No speech")):
+                st.session_state.recognized_text = result
+                st.success("Transcription completed!")
+            else:
+                st.error(result)
 
     if st.session_state.recognized_text:
         st.subheader("Recognized Text")